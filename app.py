@@ -1,90 +1,143 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-import pandas as pd
-import gpxpy
-import folium
-from streamlit_folium import st_folium
-import matplotlib.pyplot as plt
+import numpy as np
 import requests #for sending the feedback data to email service
-from folium.plugins import Fullscreen
-import streamlit.components.v1 as components
-from html_utils import generate_audio_map_html, generate_client_side_replay
+from data_io import parse_gpx, load_csv, join_datasets
 
 #set format to wide desktop screen:
 st.set_page_config(layout="wide", page_title="CoxOrb Data Visualiser")
 
+# Metrics offered in the performance plot, in display order
+PLOT_METRICS = ('Rate', 'Split (s/500m)', 'Speed (m/s)', 'Distance/Stroke', 'Check')
+
+# Formspree endpoint that forwards the feedback form to the developer
+FORMSPREE_URL = "https://formspree.io/f/xpwvvnkn"
+
+# Rough email check for the contact form (Formspree does the real validation)
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Number of rows shown in the raw data views (the full data is available as a download)
+RAW_PREVIEW_ROWS = 200
+
+# Key of the container around the st.audio player; the audio map finds the player through it
+AUDIO_PLAYER_KEY = "audio_player"
+
 #check:
 try:
     from html_utils import generate_audio_map_html, generate_client_side_replay
 except ImportError:
     st.error("Could not import 'html_utils.py'. Please make sure the file exists and is named correctly.")
 
-def parse_time_str(time_str):
+def simplify_track(lats, lons, epsilon=1e-5):
     """
-    Parses time strings like '00:15:30' or '15:30.5' into total seconds.
-    Used for the CSV 'Elapsed Time' column.
-    round to the nearest integer
+    Ramer-Douglas-Peucker simplification of a GPS track, used only for drawing the route.
+    Keeps the points that deviate more than epsilon (degrees of latitude, 1e-5 ~ 1 m) from the simplified line.
+
+    Parameters:
+    -----------
+    lats, lons : array-like
+        Latitude and longitude of every track point.
+    epsilon : float
+        Maximum allowed deviation from the original track.
+
+    Returns:
+    --------
+    np.ndarray
+        Sorted indices of the points to keep (always includes the first and last point).
     """
-    try:
-        if pd.isna(time_str): return 0
-        # If it's already a number, return the rounded integer
-        if isinstance(time_str, (int, float)): return int(round(time_str))
-        
-        parts = str(time_str).split(':')
-        total_seconds = 0.0
-        
-        if len(parts) == 3: # HH:MM:SS
-            h, m, s = parts
-            total_seconds = int(h) * 3600 + int(m) * 60 + float(s)
-        elif len(parts) == 2: # MM:SS
-            m, s = parts
-            total_seconds = int(m) * 60 + float(s)
-            
-        return int(round(total_seconds))
-    except:
-        return 0
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n < 3:
+        return np.arange(n)
+
+    # Scale longitude so both axes are in (roughly) the same unit as epsilon
+    x = lons * np.cos(np.radians(lats.mean()))
+    y = lats
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative instead of recursive, so long tracks can't hit the recursion limit
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        seg_len = np.hypot(dx, dy)
+        if seg_len == 0:
+            dist = np.hypot(px, py)
+        else:
+            # Perpendicular distance of every inner point to the start-end line
+            dist = np.abs(dx * py - dy * px) / seg_len
+
+        i_max = int(np.argmax(dist))
+        if dist[i_max] > epsilon:
+            mid = start + 1 + i_max
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+
+    return np.flatnonzero(keep)
 
-def parse_gpx(file_buffer):
+@st.cache_data(show_spinner=False)
+def build_route_map(file_bytes):
     """
-    Parses a GPX file buffer and returns a DataFrame of coordinates. + add "seconds_elapsed" column to compare with csv files
+    Builds the folium map with the (simplified) route of a GPX file and renders it to HTML.
+    Cached on the file content, so reruns reuse the finished page instead of rebuilding the map
+    and re-rendering folium's templates.
 
     Parameters:
     -----------
-    file_buffer : UploadedFile
-        The GPX file object uploaded by the user.
+    file_bytes : bytes
+        The raw content of the GPX file.
 
     Returns:
     --------
-    pd.DataFrame
-        A DataFrame containing 'latitude' and 'longitude' columns.
+    str
+        The standalone HTML page of the route map, centered on the starting point.
     """
-    # Parse the GPX file using gpxpy library
-    gpx = gpxpy.parse(file_buffer)
-    
-    # Extract point data from tracks/segments
-    data = []
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                data.append({
-                    'latitude': point.latitude,
-                    'longitude': point.longitude,
-                    'time': point.time
-                })
-    df = pd.DataFrame(data)
+    # Imported here so visitors who never upload a GPX file don't pay for folium on startup
+    import folium
+    from folium.plugins import Fullscreen
 
-    #Convert absolute time to elapsed seconds
-    if not df.empty and 'time' in df.columns:
-        # Ensure time is in datetime format (gpxpy usually does this, but being safe)
-        df['time'] = pd.to_datetime(df['time'])
-        
-        # Get the start time (first entry)
-        start_time = df['time'].iloc[0]
-        
-        # Calculate difference and convert to total seconds
-        df['seconds_elapsed'] = (df['time'] - start_time).dt.total_seconds()
-    
-    return df
+    gpx_df = parse_gpx(file_bytes)
+    lats = gpx_df['latitude'].to_numpy()
+    lons = gpx_df['longitude'].to_numpy()
+
+    # Center map on the starting point
+    # prefer_canvas: draw vector layers on one <canvas> instead of an SVG node per path
+    m = folium.Map(location=[lats[0], lons[0]], zoom_start=14, prefer_canvas=True)
+
+    # Draw the route line (PolyLine), simplified so the browser only gets the points it needs
+    keep = simplify_track(lats, lons)
+    coordinates = np.column_stack([lats[keep], lons[keep]]).tolist()
+    folium.PolyLine(coordinates, color="blue", weight=2.5, opacity=1).add_to(m)
+
+    # Add Fullscreen Button
+    Fullscreen().add_to(m)
+
+    return m.get_root().render()
+
+def render_route_map(file_bytes):
+    """
+    Renders the cached route map of a GPX file.
+    Display-only: the app never reads the map state, so it is a plain st.iframe
+    (no st_folium bridge sending pan/zoom/click events back to Python).
+
+    Parameters:
+    -----------
+    file_bytes : bytes
+        The raw content of the GPX file.
+    """
+    # Build the route map page (cached per GPX file) and render it in Streamlit
+    st.iframe(build_route_map(file_bytes), height=550)
 
+@st.fragment
 def plot_metrics(df):
     """
     Generates a line chart for rowing metrics (Rate/Speed) from CSV data.
@@ -98,25 +151,11 @@ def plot_metrics(df):
     -----------
     df : pd.DataFrame
         The DataFrame containing CoxOrb CSV data.
+
+    Runs as a fragment: changing the metric selection only reruns this chart, not the whole page.
     """
-    import altair as alt
-
-    # 1. Clean column names (Remove the rename logic!)
-    df.columns = [c.strip() for c in df.columns]
-
-    # 2. Define Metrics (Include Speed AND Split)
-    wanted_cols = ['Rate', 'Split (s/500m)', 'Speed (m/s)', 'Distance/Stroke', 'Check']
-    available_cols = [c for c in wanted_cols if c in df.columns]
-
-    # 3. Create Formatted Split Column for Tooltips (mm:ss.t)
-    if 'Split (s/500m)' in df.columns:
-        def fmt_split(secs):
-            if pd.isna(secs) or secs <= 0: return "-"
-            m = int(secs // 60)
-            s = secs % 60
-            return f"{m}:{s:04.1f}"
-        
-        df['Split_Formatted'] = df['Split (s/500m)'].apply(fmt_split)
+    # 1. Define Metrics (Include Speed AND Split) - column names are already stripped by load_csv
+    available_cols = [c for c in PLOT_METRICS if c in df.columns]
 
     if available_cols:
         st.subheader("Performance Metrics (Static Plot)")
@@ -135,60 +174,82 @@ def plot_metrics(df):
             # Determine X-axis
             if 'Distance' in df.columns:
                 x_axis = 'Distance'
+                x_type = 'quantitative'
                 x_title = "Distance (m)"
             elif 'Elapsed Time' in df.columns:
                 x_axis = 'Elapsed Time'
+                x_type = 'nominal'
                 x_title = "Time"
             else:
                 x_axis = 'index'
+                x_type = 'quantitative'
                 df = df.reset_index()
                 x_title = "Stroke Number"
 
-            # --- BUILD ALTAIR LAYERS ---
+            # We filter out 'Split (s/500m)' so it doesn't appear on the left
+            left_metrics = [c for c in cols_to_plot if c != 'Split (s/500m)']
+
+            # One narrow dataset shared by both layers: only the x column, the selected metrics and the split label.
+            # The left metrics are folded into long format by Vega in the browser instead of melted (and sent) from here.
+            chart_cols = [x_axis] + cols_to_plot
+            if 'Split (s/500m)' in cols_to_plot:
+                chart_cols.append('Split_Formatted')
+            chart_data = df[chart_cols]
+            x_enc = {'field': x_axis, 'type': x_type, 'title': x_title}
+
+            # --- BUILD VEGA-LITE LAYERS ---
+            # Plain Vega-Lite dicts rather than Altair objects: this runs on every rerun, and building/validating
+            # the Altair chart cost far more than the chart itself.
             layers = []
             
             # 1. Handle "Split" (Right Axis, Inverted, Green)
             if 'Split (s/500m)' in cols_to_plot:
-                split_layer = alt.Chart(df).mark_line(color='#2ca02c').encode(
-                    x=alt.X(x_axis, title=x_title),
-                    y=alt.Y('Split (s/500m)', 
-                            title='Split (s/500m)',
-                            scale=alt.Scale(reverse=True, zero=False), # Inverted
-                            axis=alt.Axis(orient='right', titleColor='#2ca02c')), 
-                    tooltip=[
-                        alt.Tooltip(x_axis, title=x_title),
-                        alt.Tooltip('Split_Formatted', title='Split (mm:ss.t)'),
-                        alt.Tooltip('Split (s/500m)', title='Raw Seconds')
-                    ]
-                )
-                layers.append(split_layer)
+                layers.append({
+                    'mark': {'type': 'line', 'color': '#2ca02c'},
+                    'encoding': {
+                        'x': x_enc,
+                        'y': {'field': 'Split (s/500m)', 'type': 'quantitative', 'title': 'Split (s/500m)',
+                              'scale': {'reverse': True, 'zero': False}, # Inverted
+                              'axis': {'orient': 'right', 'titleColor': '#2ca02c'}},
+                        'tooltip': [
+                            {'field': x_axis, 'type': x_type, 'title': x_title},
+                            {'field': 'Split_Formatted', 'type': 'nominal', 'title': 'Split (mm:ss.t)'},
+                            {'field': 'Split (s/500m)', 'type': 'quantitative', 'title': 'Raw Seconds'}
+                        ]
+                    }
+                })
 
             # 2. Handle Other Metrics (Left Axis - Rate, Speed, etc.)
-            # We filter out 'Split (s/500m)' so it doesn't appear on the left
-            left_metrics = [c for c in cols_to_plot if c != 'Split (s/500m)']
-            
             if left_metrics:
-                # Melt data for left metrics
-                left_data = df[[x_axis] + left_metrics].melt(x_axis, var_name='Metric', value_name='Value')
-                
-                left_layer = alt.Chart(left_data).mark_line().encode(
-                    x=alt.X(x_axis, title=x_title),
-                    y=alt.Y('Value', title=' / '.join(left_metrics), scale=alt.Scale(zero=False)),
-                    color=alt.Color('Metric', legend=alt.Legend(orient='bottom')),
-                    tooltip=[x_axis, 'Metric', 'Value']
-                )
-                layers.append(left_layer)
+                layers.append({
+                    'transform': [{'fold': left_metrics, 'as': ['Metric', 'Value']}],
+                    'mark': {'type': 'line'},
+                    'encoding': {
+                        'x': x_enc,
+                        'y': {'field': 'Value', 'type': 'quantitative', 'title': ' / '.join(left_metrics),
+                              'scale': {'zero': False}},
+                        'color': {'field': 'Metric', 'type': 'nominal', 'legend': {'orient': 'bottom'}},
+                        'tooltip': [
+                            {'field': x_axis, 'type': x_type},
+                            {'field': 'Metric', 'type': 'nominal'},
+                            {'field': 'Value', 'type': 'quantitative'}
+                        ]
+                    }
+                })
 
             if layers:
+                # Pan/zoom on the first layer (what Altair's .interactive() did)
+                layers[0]['params'] = [{'name': 'zoom', 'select': {'type': 'interval', 'encodings': ['x', 'y']}, 'bind': 'scales'}]
+
                 # Combine layers
-                combined_chart = alt.layer(*layers).resolve_scale(
-                    y='independent'
-                ).properties(
-                    height=500,
-                    width='container'
-                ).interactive()
-
-                st.altair_chart(combined_chart, use_container_width=True)
+                spec = {
+                    'layer': layers,
+                    'resolve': {'scale': {'y': 'independent'}},
+                    'height': 500,
+                    'width': 'container'
+                }
+
+                st.vega_lite_chart(chart_data, spec, width='stretch')
             else:
                 st.info("Please select a metric.")
         else:
@@ -196,6 +257,39 @@ def plot_metrics(df):
     else:
         st.warning("Could not identify standard CoxOrb columns for the graph.")
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_demo_bytes(url):
+    """
+    Downloads one of the demo files from GitHub, over the shared keep-alive session.
+    Cached for an hour, so every visitor (and every rerun) in demo mode doesn't download the files again.
+    Failed downloads raise instead of returning, so they are not cached.
+
+    Parameters:
+    -----------
+    url : str
+        Raw GitHub URL of the demo file.
+
+    Returns:
+    --------
+    bytes
+        The file content.
+    """
+    response = get_http_session().get(url, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+@st.cache_resource
+def get_http_session():
+    """
+    Returns one requests.Session shared across reruns, so repeated requests
+    reuse the open (keep-alive) connection instead of a new TCP + TLS handshake.
+    Pools for the three hosts used (Formspree, raw.githubusercontent.com, github.com),
+    with room for the parallel demo downloads.
+    """
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=3, pool_maxsize=4))
+    return session
+
 def send_simple_email(name, email, subject, message):
     """
     Sends the user feedback to the developer via the Formspree API.
@@ -213,12 +307,11 @@ def send_simple_email(name, email, subject, message):
 
     Returns:
     --------
-    int
-        The HTTP status code of the request (200 indicates success).
+    tuple
+        The HTTP status code of the request (200 indicates success, None if it could not be sent)
+        and the response text (or the error message).
     """
 
-    api_url = "https://formspree.io/f/xpwvvnkn"
-
     payload = {
         "name": name,
         "_replyto": email,
@@ -226,34 +319,289 @@ def send_simple_email(name, email, subject, message):
         "message": message
     }
 
-    # Post the data to the API
-    response = requests.post(api_url, data=payload)
+    # Post the data to the API (timeout so a slow server can't hang the page)
+    try:
+        response = get_http_session().post(FORMSPREE_URL, data=payload, timeout=10)
+    except requests.RequestException as e:
+        return None, str(e)
     return response.status_code, response.text
 
-def merge_datasets(gpx_df, csv_df):
+@st.fragment
+def render_contact_form():
     """
-    Merges GPX and CSV data based on seconds_elapsed.
-    Cached because merge_asof is expensive to run on every slider move.
+    Renders the contact & feedback form.
+    Runs as a fragment: submitting the form only reruns this function, not the whole page
+    (GPX/CSV processing, maps, charts).
     """
-    gpx_clean = gpx_df.dropna(subset=['seconds_elapsed']).copy()
-    csv_clean = csv_df.dropna(subset=['seconds_elapsed']).copy()
+    with st.form("contact_form", clear_on_submit=True):
+        # Layout the input fields
+        col1, col2 = st.columns(2)
+        with col1:
+            name_input = st.text_input("Name")
+        with col2:
+            email_input = st.text_input("Contact Email", placeholder="name@example.com", help="Used only to reply to your message.")
     
-    gpx_clean['seconds_elapsed'] = gpx_clean['seconds_elapsed'].astype(int)
-    csv_clean['seconds_elapsed'] = csv_clean['seconds_elapsed'].astype(int)
+        subject_input = st.text_input("Subject Header")
+        message_input = st.text_area("Main Text")
     
-    gpx_sorted = gpx_clean.sort_values('seconds_elapsed')
-    csv_sorted = csv_clean.sort_values('seconds_elapsed')
-
-    merged_df = pd.merge_asof(
-        csv_sorted, 
-        gpx_sorted[['seconds_elapsed', 'latitude', 'longitude']], 
-        on='seconds_elapsed', 
-        direction='nearest',
-        tolerance=5 
-    )
-    
-    return merged_df.dropna(subset=['latitude', 'longitude'])
+        # Form submit button
+        submitted = st.form_submit_button("Send Feedback")
+
+        if submitted:
+            # Basic validation to ensure fields are not empty
+            if not (name_input and email_input and message_input):
+                st.error("Please fill in your name, email, and a message.")
+            elif not EMAIL_PATTERN.match(email_input.strip()):
+                # Don't send the request if Formspree would reject the address anyway
+                st.error("Please enter a valid email address.")
+            else:
+                # Get both status and response text
+                status, response_text = send_simple_email(name_input, email_input, subject_input, message_input)
+
+                if status == 200:
+                    st.success("Message sent successfully! Thank you for your feedback; we will get back to you as soon as possible.")
+                else:
+                    st.error(f"Failed to send. Status Code: {status}")
+                    with st.expander("See Error Details"):
+                        st.text(response_text)
+
+@st.cache_data(show_spinner=False)
+def build_replay_html(gpx_bytes, csv_bytes):
+    """
+    Builds the client-side replay page for a GPX + CSV pair.
+    Cached on the raw file bytes, so reruns with the same files reuse the finished HTML
+    instead of serializing the merged data into the page again.
+
+    Parameters:
+    -----------
+    gpx_bytes : bytes
+        The raw content of the GPX file.
+    csv_bytes : bytes
+        The raw content of the CSV file.
 
+    Returns:
+    --------
+    str or None
+        The replay HTML, or None if no CSV row could be matched to a GPX point.
+    """
+    # Same cached parse + join as the other sections
+    merged_df_client, _ = join_datasets(parse_gpx(gpx_bytes), load_csv(csv_bytes))
+    if merged_df_client.empty:
+        return None
+
+    # Generate HTML using the imported utility function
+    return generate_client_side_replay(merged_df_client)
+
+@st.cache_data(show_spinner=False)
+def build_audio_map_html(gpx_bytes, csv_bytes):
+    """
+    Builds the audio-synced map page for a GPX file (with the stats of a CSV file, if there is one).
+    Cached on the raw file bytes like build_replay_html, so playing/seeking reruns reuse the finished HTML.
+
+    Parameters:
+    -----------
+    gpx_bytes : bytes
+        The raw content of the GPX file.
+    csv_bytes : bytes or None
+        The raw content of the CSV file, None for a map without stats.
+
+    Returns:
+    --------
+    str or None
+        The map HTML, or None if the GPX file has no time info to sync on.
+    """
+    gpx_df = parse_gpx(gpx_bytes)
+    if 'seconds_elapsed' not in gpx_df.columns:
+        return None
+
+    # Prepare the data for Audio Sync
+    if csv_bytes is not None:
+        # If CSV exists, merge stats ONTO the GPX data (same cached join as the replay, keeps all the 1Hz map points)
+        _, audio_data = join_datasets(gpx_df, load_csv(csv_bytes))
+    else:
+        # If no CSV, just use the GPX data (stats will show as "--")
+        audio_data = gpx_df
+
+    # Generate HTML
+    return generate_audio_map_html(audio_data, AUDIO_PLAYER_KEY)
+
+@st.fragment
+def render_audio_section(gpx_bytes, csv_bytes, audio_bytes, audio_type):
+    """
+    Audio analysis section: audio upload (unless the demo recording is loaded) and the map + stats
+    that follow the audio player.
+    A fragment, so uploading a recording only reruns this section.
+
+    Parameters:
+    -----------
+    gpx_bytes : bytes or None
+        Raw GPX file that parsed successfully (needs timestamps for the sync).
+    csv_bytes : bytes or None
+        Raw CSV file that parsed successfully, merged onto the GPX points for the stats display.
+    audio_bytes : bytes or None
+        Preloaded recording (demo mode), None to show the uploader.
+    audio_type : str
+        MIME type of audio_bytes.
+    """
+    st.markdown("---")
+    st.header("Audio Analysis")
+
+    # if NOT in demo mode (or demo download failed), allow upload
+    if audio_bytes is None:
+        st.write("Upload an audio recording (e.g., Cox recording) to play it in sync with the map.")
+        uploaded_audio = st.file_uploader("Upload Audio File (MP3/WAV/M4A)", type=['mp3', 'wav', 'm4a', 'ogg'])
+
+        if uploaded_audio:
+            audio_bytes = uploaded_audio.getvalue()
+            audio_type = uploaded_audio.type
+    else:
+        st.write("Playing loaded audio in sync with the map.")
+
+    # Process Audio Logic
+    if gpx_bytes is not None and audio_bytes is not None:
+        st.write("Loading audio player and map sync...")
+
+        # Map + stats page (cached per file pair)
+        audio_html = build_audio_map_html(gpx_bytes, csv_bytes)
+
+        if audio_html is not None:
+            # Streamlit serves the audio from its media endpoint; the map component only follows this player
+            with st.container(key=AUDIO_PLAYER_KEY):
+                st.audio(audio_bytes, format=audio_type)
+            # st.iframe embeds HTML as a same-origin srcdoc frame, which the player lookup in the page relies on
+            st.iframe(audio_html, height=560) # Height to fit stats + map
+        else:
+            st.error("GPX data does not have time info required for sync.")
+
+@st.cache_data(show_spinner=False)
+def build_compare_map(tracks):
+    """
+    Builds the comparison map with all given tracks and renders it to HTML.
+    Tracks that fail to parse are left out and reported back.
+    Cached on the raw file bytes (plus colors/names), so reruns reuse the finished page
+    instead of rebuilding the map and re-rendering folium's templates.
+
+    Parameters:
+    -----------
+    tracks : tuple of (bytes, str, str)
+        (GPX file content, line color, name) for every track to draw.
+
+    Returns:
+    --------
+    tuple
+        (html, failed): the standalone HTML page of the comparison map (None if no track parsed),
+        and a list of (name, error message) for the tracks that could not be parsed.
+    """
+    import folium
+    from folium.plugins import Fullscreen
+
+    track_dfs, drawn, failed = [], [], []
+    for gpx_bytes, color, name in tracks:
+        try:
+            track_dfs.append(parse_gpx(gpx_bytes))
+            drawn.append((color, name))
+        except Exception as e:
+            failed.append((name, str(e)))
+
+    if not track_dfs:
+        return None, failed
+
+    # Combined bounds from the per-track min/max, without concatenating the tracks
+    sw = [min(df['latitude'].min() for df in track_dfs), min(df['longitude'].min() for df in track_dfs)]
+    ne = [max(df['latitude'].max() for df in track_dfs), max(df['longitude'].max() for df in track_dfs)]
+
+    # prefer_canvas: all tracks share one <canvas> instead of an SVG node per path
+    m_compare = folium.Map(location=[(sw[0]+ne[0])/2, (sw[1]+ne[1])/2], zoom_start=13, prefer_canvas=True)
+    m_compare.fit_bounds([sw, ne])
+    Fullscreen().add_to(m_compare)
+
+    # All tracks go into one GeoJSON layer (simplified; GeoJSON wants [lon, lat] pairs)
+    features = []
+    for df, (color, name) in zip(track_dfs, drawn):
+        lats = df['latitude'].to_numpy()
+        lons = df['longitude'].to_numpy()
+        keep = simplify_track(lats, lons)
+        features.append({
+            'type': 'Feature',
+            'properties': {'name': name, 'color': color},
+            'geometry': {'type': 'LineString', 'coordinates': np.column_stack([lons[keep], lats[keep]]).tolist()}
+        })
+
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        style_function=lambda f: {'color': f['properties']['color'], 'weight': 3, 'opacity': 0.7},
+        tooltip=folium.GeoJsonTooltip(fields=['name'], labels=False)
+    ).add_to(m_compare)
+
+    return m_compare.get_root().render(), failed
+
+@st.fragment
+def render_compare_section(demo_mode, gpx_bytes, comp_gpx_bytes):
+    """
+    Compare GPX Lines section: up to three uploaded tracks (or the two demo tracks) on one map.
+    A fragment, so the comparison uploads and map interactions only rerun this section.
+
+    Parameters:
+    -----------
+    demo_mode : bool
+        Whether the demo data is shown.
+    gpx_bytes : bytes or None
+        Main demo GPX file.
+    comp_gpx_bytes : bytes or None
+        Demo comparison GPX file.
+    """
+    st.markdown("---")
+    st.header("Compare GPX Lines")
+
+    # Tracks to draw, as (GPX bytes, color, name); build_compare_map parses them
+    tracks_to_plot = []
+
+    if demo_mode:
+        # --- DEMO COMPARISON LOGIC ---
+        st.info("Demo Mode: Showing comparison between 'Demo Track' (Blue) and 'Comparison Track' (Red)")
+
+        # 1. Use the main GPX loaded earlier
+        if gpx_bytes:
+            tracks_to_plot.append((gpx_bytes, 'blue', 'Demo Track 1'))
+
+        # 2. Use the comparison GPX downloaded in the demo block
+        if comp_gpx_bytes:
+            tracks_to_plot.append((comp_gpx_bytes, 'red', 'Comparison Track'))
+
+    else:
+        # --- UPLOAD COMPARISON LOGIC ---
+        st.write("Upload up to three different GPX files to compare their steering lines.")
+        col1, col2, col3 = st.columns(3)
+        comp_1 = col1.file_uploader("Upload Track 1 (Blue)", type=['gpx'], key="comp1")
+        comp_2 = col2.file_uploader("Upload Track 2 (Red)", type=['gpx'], key="comp2")
+        comp_3 = col3.file_uploader("Upload Track 3 (Black)", type=['gpx'], key="comp3")
+
+        for f, color, name in ((comp_1, 'blue', 'Track 1'), (comp_2, 'red', 'Track 2'), (comp_3, 'black', 'Track 3')):
+            if f:
+                tracks_to_plot.append((f.getvalue(), color, name))
+
+    # Common plotting logic for both modes
+    if tracks_to_plot:
+        try:
+            # Map page (cached per set of tracks); display-only, so a plain iframe instead of the st_folium bridge
+            compare_html, failed = build_compare_map(tuple(tracks_to_plot))
+
+            # Uploads that don't parse get an error each; a broken demo file is just left out
+            if not demo_mode:
+                for name, error in failed:
+                    st.error(f"Error {name}: {error}")
+            if compare_html is None:
+                return
+
+            st.iframe(compare_html, height=500)
+
+            st.markdown("""<div style="display: flex; gap: 20px; justify-content: center; margin-top: 10px;">
+                <span style="color: blue; font-weight: bold;">■ Track 1</span>
+                <span style="color: red; font-weight: bold;">■ Track 2</span>
+                <span style="color: black; font-weight: bold;">■ Track 3</span>
+            </div>""", unsafe_allow_html=True)
+        except Exception as e:
+            st.error(f"Error processing comparison map: {e}")
 
 # --- Main App Logic ---
 
@@ -288,7 +636,7 @@ else:
 gpx_df = None
 csv_df = None
 gpx_bytes = None
-csv_file = None
+csv_bytes = None
 audio_bytes = None # Added for audio
 audio_type = 'audio/mp4' # Default for demo
 comp_gpx_bytes = None # For comparison demo
@@ -303,27 +651,22 @@ if demo_mode:
         comp_url = "https://raw.githubusercontent.com/NikJur/CoxOrb/refs/heads/main/demo_data/example_comparison.gpx"
         
         with st.spinner("Downloading demo data..."):
-            gpx_response = requests.get(gpx_url)
-            csv_response = requests.get(csv_url)
-            audio_r = requests.get(audio_url)
-            comp_r = requests.get(comp_url)
-            
-            if gpx_response.status_code == 200 and csv_response.status_code == 200:
-                # GPX
-                gpx_bytes = gpx_response.content
-                #CSV
-                # For CSV, we need a file-like object for pandas
-                from io import StringIO
-                csv_file = StringIO(csv_response.text)
-                # AUDIO
-                if audio_r.status_code == 200:
-                    audio_bytes = audio_r.content
-                    
-                if comp_r.status_code == 200: comp_gpx_bytes = comp_r.content
-                    
-                st.success("Demo data loaded successfully!")
-            else:
-                st.error("Could not download demo files from GitHub. Please check the URLs.")
+            # Download the four files in parallel instead of one after the other (network bound)
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                gpx_job, csv_job, audio_job, comp_job = [pool.submit(fetch_demo_bytes, url) for url in (gpx_url, csv_url, audio_url, comp_url)]
+
+            # GPX + CSV are required (assigned together, so neither is set if one fails)
+            gpx_bytes, csv_bytes = gpx_job.result(), csv_job.result()
+
+            # AUDIO and comparison track are optional extras
+            try: audio_bytes = audio_job.result()
+            except requests.RequestException: pass
+            try: comp_gpx_bytes = comp_job.result()
+            except requests.RequestException: pass
+
+        st.success("Demo data loaded successfully!")
+    except requests.HTTPError:
+        st.error("Could not download demo files from GitHub. Please check the URLs.")
     except Exception as e:
         st.error(f"Error loading demo: {e}")
 
@@ -338,7 +681,7 @@ else:
         gpx_bytes = uploaded_gpx.getvalue()
         
     if uploaded_csv is not None:
-        csv_file = uploaded_csv
+        csv_bytes = uploaded_csv.getvalue()
 
 # 2. Process and Plot GPX (Map + Raw View)
 if gpx_bytes is not None:
@@ -347,58 +690,39 @@ if gpx_bytes is not None:
         gpx_df = parse_gpx(gpx_bytes)
 
         st.subheader("Rowing Route")
-        
-        # Center map on the starting point
-        start_location = [gpx_df['latitude'].iloc[0], gpx_df['longitude'].iloc[0]]
-        m = folium.Map(location=start_location, zoom_start=14)
-        
-        # Draw the route line (PolyLine)
-        coordinates = list(zip(gpx_df['latitude'], gpx_df['longitude']))
-        folium.PolyLine(coordinates, color="blue", weight=2.5, opacity=1).add_to(m)
-
-        # Add Fullscreen Button
-        Fullscreen().add_to(m)
-        
-        # Render map in Streamlit
-        st_folium(m, width=1200, height=550)
+        render_route_map(gpx_bytes)
 
         #View Raw GPX Data 
         with st.expander("📂 Raw GPX Data View (Click to expand)"):
-            st.write("Here is the raw data extracted from the GPX file:")
-            st.dataframe(gpx_df)
+            st.write(f"Here is the raw data extracted from the GPX file (first {RAW_PREVIEW_ROWS} rows):")
+            st.dataframe(gpx_df.head(RAW_PREVIEW_ROWS))
+            # The full table is only serialised when the button is clicked
+            st.download_button("Download full GPX data (CSV)", data=lambda df=gpx_df: df.to_csv(index=False),
+                               file_name="gpx_data.csv", mime="text/csv")
         
     except Exception as e:
         st.error(f"Error processing GPX: {e}")
 
 # 3. Process and Plot CSV (Stats)
-if csv_file is not None:
+if csv_bytes is not None:
     try:
-        # Reset pointer if it's a StringIO object from demo
-        if hasattr(csv_file, 'seek'): csv_file.seek(0)
-        # Load CSV into Pandas DataFrame
-        # header=1 tells pandas to ignore the first row ("COXORB Performance Data...") and use the second row as the actual column headers.
-        csv_df = pd.read_csv(csv_file, header=1)
-
-        # Clean column names
-        csv_df.columns = [c.strip() for c in csv_df.columns]
-
-        #Convert 'Elapsed Time' string to 'seconds_elapsed' float ---
-        if 'Elapsed Time' in csv_df.columns:
-            csv_df['seconds_elapsed'] = csv_df['Elapsed Time'].apply(parse_time_str)
-
-        #convert speed to splits
-        if 'Speed (m/s)' in csv_df.columns:
-        #Formula: 500 / Speed (m/s) = Seconds per 500m
-        #use a lambda to handle division by zero or empty values safely
-            csv_df['Split (s/500m)'] = csv_df['Speed (m/s)'].apply(lambda x: 500/x if (pd.notnull(x) and x > 0) else 0)
-        
-        # Display raw data snapshot
-        with st.expander("📂 Raw CSV Data View (Click to expand)"):
-            st.write("Here is the raw data extracted from the CSV file:")
-            st.dataframe(csv_df)
-        
-        # Plot the stats
-        plot_metrics(csv_df)
+        # Load CSV into Pandas DataFrame (cached on the file content)
+        csv_df = load_csv(csv_bytes)
+
+        if csv_df.empty:
+            # Header-only file: nothing to show, and nothing to merge with the GPX further down
+            st.warning("The CSV file contains no data rows.")
+            csv_df = None
+        else:
+            # Display raw data snapshot
+            with st.expander("📂 Raw CSV Data View (Click to expand)"):
+                st.write(f"Here is the raw data extracted from the CSV file (first {RAW_PREVIEW_ROWS} rows):")
+                st.dataframe(csv_df.head(RAW_PREVIEW_ROWS))
+                st.download_button("Download full CSV data", data=lambda df=csv_df: df.to_csv(index=False),
+                                   file_name="csv_data.csv", mime="text/csv")
+
+            # Plot the stats
+            plot_metrics(csv_df)
         
     except Exception as e:
         st.error(f"Error processing CSV: {e}")
@@ -412,15 +736,12 @@ if gpx_df is not None and csv_df is not None:
     st.caption("This runs entirely in your browser. Drag the slider for instant feedback. Click on the graph legend items to select/deselect them. If there are stationary periods at the beginning or end of your recording, trim them with the sliders to rescale the y-axes.")
 
     try:
-        # Re-merge using the cached function (instant)
-        merged_df_client = merge_datasets(gpx_df, csv_df)
+        # Merge + generate the page (cached per file pair, instant on reruns)
+        replay_html = build_replay_html(gpx_bytes, csv_bytes)
         
-        if not merged_df_client.empty:
-            # Generate HTML using the imported utility function
-            replay_html = generate_client_side_replay(merged_df_client)
-            
+        if replay_html is not None:
             # Render the HTML component
-            components.html(replay_html, height=520)
+            st.iframe(replay_html, height=520)
         else:
             st.warning("Data could not be merged for the client-side view.")
 
@@ -429,119 +750,12 @@ if gpx_df is not None and csv_df is not None:
         
 
 # 5. --- Audio Analysis Section ---
-st.markdown("---")
-st.header("Audio Analysis")
-
-# if NOT in demo mode (or demo download failed), allow upload
-if audio_bytes is None:
-    st.write("Upload an audio recording (e.g., Cox recording) to play it in sync with the map.")
-    uploaded_audio = st.file_uploader("Upload Audio File (MP3/WAV/M4A)", type=['mp3', 'wav', 'm4a', 'ogg'])
-    
-    if uploaded_audio:
-        audio_bytes = uploaded_audio.getvalue()
-        audio_type = uploaded_audio.type
-else:
-    st.write("Playing loaded audio in sync with the map.")
-
-# Process Audio Logic
-if gpx_df is not None and audio_bytes is not None:
-    st.write("Loading audio player and map sync...")
-    
-    if 'seconds_elapsed' in gpx_df.columns:
-        # Prepare the data for Audio Sync
-        if csv_df is not None:
-            # If CSV exists, merge stats ONTO the GPX data.
-            # We use merge_asof with GPX as the left table to keep the high-frequency map points (1Hz)
-            # while pulling in the closest available stats from the CSV.
-
-            # Merge stats onto GPX
-            # Ensure types match
-            gpx_df['seconds_elapsed'] = gpx_df['seconds_elapsed'].astype(int)
-            csv_df['seconds_elapsed'] = csv_df['seconds_elapsed'].astype(int)
-            
-            audio_data = pd.merge_asof(
-                gpx_df.sort_values('seconds_elapsed'),
-                csv_df.sort_values('seconds_elapsed'),
-                on='seconds_elapsed',
-                direction='nearest',
-                tolerance=5
-            )
-        else:
-            # If no CSV, just use the GPX data (stats will show as "--")
-            audio_data = gpx_df
-
-        # Generate HTML
-        audio_html = generate_audio_map_html(audio_data, audio_bytes, audio_type)
-        components.html(audio_html, height=600) # Increased height to fit stats + map + player
-    else:
-        st.error("GPX data does not have time info required for sync.")
+# (only pass on the files that parsed above)
+render_audio_section(gpx_bytes if gpx_df is not None else None, csv_bytes if csv_df is not None else None,
+                     audio_bytes, audio_type)
 
 # 5. Compare Two GPX Lines ---
-
-st.markdown("---")
-st.header("Compare GPX Lines")
-
-# List to store successfully parsed tracks
-tracks_to_plot = []
-
-if demo_mode:
-    # --- DEMO COMPARISON LOGIC ---
-    st.info("Demo Mode: Showing comparison between 'Demo Track' (Blue) and 'Comparison Track' (Red)")
-    
-    # 1. Use the main GPX loaded earlier
-    if gpx_bytes:
-        try: tracks_to_plot.append({'data': parse_gpx(gpx_bytes), 'color': 'blue', 'name': 'Demo Track 1'})
-        except: pass
-        
-    # 2. Use the comparison GPX downloaded in the demo block
-    if comp_gpx_bytes:
-        try: tracks_to_plot.append({'data': parse_gpx(comp_gpx_bytes), 'color': 'red', 'name': 'Comparison Track'})
-        except: pass
-
-else:
-    # --- UPLOAD COMPARISON LOGIC ---
-    st.write("Upload up to three different GPX files to compare their steering lines.")
-    col1, col2, col3 = st.columns(3)
-    comp_1 = col1.file_uploader("Upload Track 1 (Blue)", type=['gpx'], key="comp1")
-    comp_2 = col2.file_uploader("Upload Track 2 (Red)", type=['gpx'], key="comp2")
-    comp_3 = col3.file_uploader("Upload Track 3 (Black)", type=['gpx'], key="comp3")
-
-    if comp_1:
-        try: tracks_to_plot.append({'data': parse_gpx(comp_1.getvalue()), 'color': 'blue', 'name': 'Track 1'})
-        except Exception as e: st.error(f"Error Track 1: {e}")
-    if comp_2:
-        try: tracks_to_plot.append({'data': parse_gpx(comp_2.getvalue()), 'color': 'red', 'name': 'Track 2'})
-        except Exception as e: st.error(f"Error Track 2: {e}")
-    if comp_3:
-        try: tracks_to_plot.append({'data': parse_gpx(comp_3.getvalue()), 'color': 'black', 'name': 'Track 3'})
-        except Exception as e: st.error(f"Error Track 3: {e}")
-
-# Common plotting logic for both modes
-if tracks_to_plot:
-    try:
-        all_lats = pd.concat([t['data']['latitude'] for t in tracks_to_plot])
-        all_lons = pd.concat([t['data']['longitude'] for t in tracks_to_plot])
-        sw, ne = [all_lats.min(), all_lons.min()], [all_lats.max(), all_lons.max()]
-        
-        m_compare = folium.Map(location=[(sw[0]+ne[0])/2, (sw[1]+ne[1])/2], zoom_start=13)
-        m_compare.fit_bounds([sw, ne])
-        Fullscreen().add_to(m_compare)
-        
-        for track in tracks_to_plot:
-            folium.PolyLine(
-                list(zip(track['data']['latitude'], track['data']['longitude'])), 
-                color=track['color'], weight=3, opacity=0.7, tooltip=track['name']
-            ).add_to(m_compare)
-        
-        st_folium(m_compare, width=1200, height=500, key="compare_map")
-        
-        st.markdown("""<div style="display: flex; gap: 20px; justify-content: center; margin-top: 10px;">
-            <span style="color: blue; font-weight: bold;">■ Track 1</span>
-            <span style="color: red; font-weight: bold;">■ Track 2</span>
-            <span style="color: black; font-weight: bold;">■ Track 3</span>
-        </div>""", unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error processing comparison map: {e}")
+render_compare_section(demo_mode, gpx_bytes, comp_gpx_bytes)
 
 
 # 6. Feedback Part on the Bottom of the page:
@@ -562,31 +776,4 @@ st.header("Contact & Feedback")
 st.write("Have suggestions? Send a message directly using the form below.")
 
 # 6.2. Contact Form
-with st.form("contact_form", clear_on_submit=True):
-    # Layout the input fields
-    col1, col2 = st.columns(2)
-    with col1:
-        name_input = st.text_input("Name")
-    with col2:
-        email_input = st.text_input("Contact Email")
-    
-    subject_input = st.text_input("Subject Header")
-    message_input = st.text_area("Main Text")
-    
-    # Form submit button
-    submitted = st.form_submit_button("Send Feedback")
-
-    if submitted:
-        # Basic validation to ensure fields are not empty
-        if not (name_input and email_input and message_input):
-            st.error("Please fill in your name, email, and a message.")
-        else:
-            # Get both status and response text
-            status, response_text = send_simple_email(name_input, email_input, subject_input, message_input)
-
-            if status == 200:
-                st.success("Message sent successfully! Thank you for your feedback; we will get back to you as soon as possible.")
-            else:
-                st.error(f"Failed to send. Status Code: {status}")
-                with st.expander("See Error Details"):
-                    st.text(response_text)
+render_contact_form()
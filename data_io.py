@@ -0,0 +1,236 @@
+import io
+import streamlit as st
+import pandas as pd
+import numpy as np
+import xml.etree.ElementTree as ET
+
+def parse_time_series(time_col):
+    """
+    Parses a column of time strings like '00:15:30' or '15:30.5' into total seconds.
+    Used for the CSV 'Elapsed Time' column; works on the whole Series at once.
+    round to the nearest integer, unparseable entries become 0
+    """
+    # If it's already numeric, only round to integers
+    if pd.api.types.is_numeric_dtype(time_col):
+        return time_col.fillna(0).round().astype(np.int32)
+
+    text = time_col.astype(str).str.strip()
+    n_colons = text.str.count(':')
+
+    # Split into up to three numeric parts (missing parts become NaN)
+    parts = text.str.split(':', expand=True).reindex(columns=range(3))
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+
+    total_seconds = np.select(
+        [n_colons == 2, n_colons == 1, n_colons == 0],
+        [
+            parts[0] * 3600 + parts[1] * 60 + parts[2], # HH:MM:SS
+            parts[0] * 60 + parts[1],                   # MM:SS
+            pd.to_numeric(text, errors='coerce')        # plain number
+        ],
+        default=np.nan
+    )
+
+    return pd.Series(np.nan_to_num(np.round(total_seconds)).astype(np.int32), index=time_col.index)
+
+def fmt_split(secs):
+    """
+    Formats a split in seconds as 'm:ss.t' (e.g. 105.3 -> '1:45.3'), '-' if there is no valid split.
+    """
+    if pd.isna(secs) or secs <= 0: return "-"
+    m = int(secs // 60)
+    s = secs % 60
+    return f"{m}:{s:04.1f}"
+
+def format_splits(splits):
+    """
+    Formats a Series of splits with fmt_split.
+    Splits repeat a lot (speeds are logged to 0.01 m/s), so each distinct value is formatted once
+    and the results are mapped back, instead of one Python call per row.
+    """
+    return splits.map({v: fmt_split(v) for v in splits.unique()})
+
+@st.cache_data(show_spinner=False)
+def parse_gpx(file_bytes):
+    """
+    Parses raw GPX bytes and returns a DataFrame of coordinates. + add "seconds_elapsed" column to compare with csv files
+    Cached on the file content, so reruns with the same upload skip the parse.
+
+    Parameters:
+    -----------
+    file_bytes : bytes
+        The raw content of the GPX file (e.g. uploaded_file.getvalue()).
+
+    Returns:
+    --------
+    pd.DataFrame
+        A DataFrame containing 'latitude' and 'longitude' columns.
+    """
+    # Stream over the track points only, instead of building a full object tree for the whole file
+    lats, lons, times = [], [], []
+    for _, elem in ET.iterparse(io.BytesIO(file_bytes)):
+        # Tags are namespaced (e.g. '{http://www.topografix.com/GPX/1/1}trkpt'), so compare the local name
+        if elem.tag.rsplit('}', 1)[-1] != 'trkpt':
+            continue
+
+        lats.append(float(elem.get('lat')))
+        lons.append(float(elem.get('lon')))
+
+        time_text = None
+        for child in elem:
+            if child.tag.rsplit('}', 1)[-1] == 'time':
+                time_text = child.text
+                break
+        times.append(time_text)
+
+        # Free the point's children, we have everything we need
+        elem.clear()
+
+    time_index = pd.to_datetime(times, utc=True, format='ISO8601', errors='coerce')
+    df = pd.DataFrame({
+        'latitude': np.asarray(lats, dtype=np.float64),
+        'longitude': np.asarray(lons, dtype=np.float64),
+        'time': time_index
+    })
+
+    #Convert absolute time to elapsed seconds
+    if not df.empty:
+        # Work on the plain datetime64 array (UTC): a single subtraction against the start time (first entry),
+        # divided into seconds. Missing timestamps stay NaN so they can be dropped before merging.
+        time_arr = time_index.tz_localize(None).to_numpy()
+        df['seconds_elapsed'] = (time_arr - time_arr[0]) / np.timedelta64(1, 's')
+    
+    return df
+
+@st.cache_data(show_spinner=False)
+def load_csv(file_bytes):
+    """
+    Loads a CoxOrb CSV export and adds the derived 'seconds_elapsed' and 'Split (s/500m)' columns.
+    Cached on the file content, so reruns with the same upload skip the parsing.
+
+    Parameters:
+    -----------
+    file_bytes : bytes
+        The raw content of the CSV file (e.g. uploaded_file.getvalue()).
+
+    Returns:
+    --------
+    pd.DataFrame
+        The cleaned CSV data.
+    """
+    # header=1 tells pandas to ignore the first row ("COXORB Performance Data...") and use the second row as the actual column headers.
+    # Keep the default C parser: engine='pyarrow' infers 'mm:ss' columns such as 'Speed (mm:ss/500m)'
+    # as time-of-day values ('06:53' -> 06:53:00), which corrupts the splits.
+    csv_df = pd.read_csv(io.BytesIO(file_bytes), header=1)
+
+    # Clean column names
+    csv_df.columns = csv_df.columns.str.strip()
+
+    # Shrink the integer columns (Distance, Stroke Count, Check) to the smallest type that fits; this is lossless.
+    # Floats stay float64: as float32, 21.6 turns into 21.600000381469727 in the replay stats and JSON payloads.
+    int_cols = csv_df.select_dtypes('integer').columns
+    csv_df[int_cols] = csv_df[int_cols].apply(pd.to_numeric, downcast='integer')
+
+    #Convert 'Elapsed Time' string to 'seconds_elapsed' int32 (whole seconds) ---
+    if 'Elapsed Time' in csv_df.columns:
+        csv_df['seconds_elapsed'] = parse_time_series(csv_df['Elapsed Time'])
+
+    #convert speed to splits
+    if 'Speed (m/s)' in csv_df.columns:
+    #Formula: 500 / Speed (m/s) = Seconds per 500m
+    #divide only where speed > 0, so zero or empty speeds (NaN > 0 is False) stay at 0
+        speed = csv_df['Speed (m/s)'].to_numpy(dtype=np.float64)
+        split = np.zeros_like(speed)
+        np.divide(500, speed, out=split, where=speed > 0)
+        csv_df['Split (s/500m)'] = split
+
+        # Formatted split (mm:ss.t) for the chart tooltips, done here so it runs once per upload
+        csv_df['Split_Formatted'] = format_splits(csv_df['Split (s/500m)'])
+
+    return csv_df
+
+def nearest_time_index(sorted_times, query_times, tolerance=5):
+    """
+    For every query time, finds the index of the nearest entry in sorted_times (binary search,
+    same tie-breaking as pd.merge_asof(direction='nearest'): on a tie the earlier entry wins).
+
+    Parameters:
+    -----------
+    sorted_times : np.ndarray
+        Ascending times (e.g. GPX seconds_elapsed).
+    query_times : np.ndarray
+        Times to look up (e.g. CSV seconds_elapsed).
+    tolerance : int
+        Maximum allowed distance in seconds.
+
+    Returns:
+    --------
+    np.ndarray
+        Index into sorted_times for every query time, -1 where nothing is within the tolerance.
+    """
+    n = len(sorted_times)
+    if n == 0:
+        return np.full(len(query_times), -1, dtype=np.intp)
+
+    # Last entry <= t (backward candidate) and first entry >= t (forward candidate)
+    backward = np.searchsorted(sorted_times, query_times, side='right') - 1
+    forward = np.searchsorted(sorted_times, query_times, side='left')
+
+    back_dist = np.where(backward >= 0, query_times - sorted_times[np.clip(backward, 0, n - 1)], np.inf)
+    fwd_dist = np.where(forward < n, sorted_times[np.clip(forward, 0, n - 1)] - query_times, np.inf)
+
+    nearest = np.where(fwd_dist < back_dist, forward, backward)
+    return np.where(np.minimum(back_dist, fwd_dist) <= tolerance, nearest, -1)
+
+@st.cache_data(show_spinner=False)
+def join_datasets(gpx_df, csv_df):
+    """
+    Matches GPX points and CSV strokes on seconds_elapsed (nearest within 5 seconds), in both directions,
+    from a single clean + sort pass over each file.
+    Cached on the content of both frames, so reruns (and the second section asking) skip the join.
+
+    Parameters:
+    -----------
+    gpx_df : pd.DataFrame
+        Output of parse_gpx.
+    csv_df : pd.DataFrame
+        Output of load_csv.
+
+    Returns:
+    --------
+    tuple of pd.DataFrame
+        (replay_df, audio_df)
+        replay_df: every CSV row with the position of the nearest GPX point, for the interactive replay;
+        rows without a GPX point that close are dropped.
+        audio_df: every GPX point with the stats of the nearest stroke, for the audio sync (keeps all the
+        1Hz map points, NaN stats where there is no stroke that close).
+    """
+    # Ensure types match (int32, the dtype load_csv already gives, so the CSV side isn't converted again)
+    gpx_clean = gpx_df.dropna(subset=['seconds_elapsed']).astype({'seconds_elapsed': 'int32'})
+    csv_clean = csv_df.dropna(subset=['seconds_elapsed']).astype({'seconds_elapsed': 'int32'})
+
+    # Both files are normally recorded in time order already, so only sort when they aren't.
+    # Stable, so points with the same second keep their file order.
+    if not gpx_clean['seconds_elapsed'].is_monotonic_increasing:
+        gpx_clean = gpx_clean.sort_values('seconds_elapsed', kind='stable')
+    if not csv_clean['seconds_elapsed'].is_monotonic_increasing:
+        csv_clean = csv_clean.sort_values('seconds_elapsed', kind='stable')
+    gpx_clean = gpx_clean.reset_index(drop=True)
+    csv_clean = csv_clean.reset_index(drop=True)
+
+    gpx_seconds = gpx_clean['seconds_elapsed'].to_numpy()
+    csv_seconds = csv_clean['seconds_elapsed'].to_numpy()
+
+    # 1. Replay: CSV rows get the nearest GPX position
+    idx = nearest_time_index(gpx_seconds, csv_seconds, tolerance=5)
+    matched = idx >= 0
+    replay_df = csv_clean[matched].reset_index(drop=True)
+    replay_df['latitude'] = gpx_clean['latitude'].to_numpy()[idx[matched]]
+    replay_df['longitude'] = gpx_clean['longitude'].to_numpy()[idx[matched]]
+
+    # 2. Audio: GPX points get the nearest CSV stats (index -1 is not a row label, so reindex leaves NaN there)
+    idx = nearest_time_index(csv_seconds, gpx_seconds, tolerance=5)
+    stats = csv_clean.drop(columns='seconds_elapsed').reindex(idx).reset_index(drop=True)
+    audio_df = pd.concat([gpx_clean, stats], axis=1)
+
+    return replay_df, audio_df
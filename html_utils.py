@@ -1,54 +1,116 @@
 import json
 import pandas as pd
-import base64
+import numpy as np
+
+# Decodes a Google encoded polyline (precision 5) into [[lat, lon], ...] in the browser
+POLYLINE_DECODER_JS = """
+            function decodePolyline(encoded) {
+                var points = [];
+                var index = 0, lat = 0, lon = 0;
+                while (index < encoded.length) {
+                    var delta = [0, 0];
+                    for (var k = 0; k < 2; k++) {
+                        var shift = 0, result = 0, b;
+                        do {
+                            b = encoded.charCodeAt(index++) - 63;
+                            result |= (b & 0x1f) << shift;
+                            shift += 5;
+                        } while (b >= 0x20);
+                        delta[k] = (result & 1) ? ~(result >> 1) : (result >> 1);
+                    }
+                    lat += delta[0];
+                    lon += delta[1];
+                    points.push([lat / 1e5, lon / 1e5]);
+                }
+                return points;
+            }
+"""
+
+def encode_polyline(lats, lons, precision=5):
+    """
+    Encodes a track with Google's polyline algorithm (zigzag deltas in 5-bit ASCII chunks).
+    About 6x smaller than a JSON array of [lat, lon] pairs; decoded by POLYLINE_DECODER_JS.
+
+    Parameters:
+    -----------
+    lats, lons : array-like
+        Coordinates in degrees.
+    precision : int
+        Decimal places kept (5 = ~1 m).
+
+    Returns:
+    --------
+    str
+        The encoded polyline.
+    """
+    coords = np.round(np.column_stack([lats, lons]) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in zigzag.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+def column_or_default(df, name, default):
+    """
+    Returns df[name], or a Series filled with default when the column is missing.
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        The data to export.
+    name : str
+        The column name.
+    default : scalar
+        The fill value for a missing column.
+
+    Returns:
+    --------
+    pd.Series
+        The column (or the filled stand-in), aligned with df.
+    """
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index)
 
-def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
+def generate_audio_map_html(input_df, player_key):
     """
-    Creates a standalone HTML component with Leaflet.js, an audio player,
-    and a synchronized stats dashboard.
+    Creates a standalone HTML component with Leaflet.js and a synchronized stats dashboard.
+    The audio itself is not embedded: the page follows the st.audio player rendered next to
+    it in the parent Streamlit page, which streams the file from Streamlit's media endpoint.
+
+    Parameters:
+    -----------
+    input_df : pd.DataFrame
+        GPX points (sorted by 'seconds_elapsed'), optionally with the CSV stats merged on.
+    player_key : str
+        Key of the st.container holding the st.audio player; the map follows the <audio> inside it.
     """
     import json
-    import base64
     import pandas as pd
 
     # 1. Prepare Data for JS
-    export_data = []
-    
-    # Check which columns are available
-    has_stats = 'Rate' in input_df.columns
-    
     # Handle column names flexibly
-    rate_col = 'Rate' if 'Rate' in input_df.columns else 'rate_placeholder'
     split_col = 'Split (s/500m)' if 'Split (s/500m)' in input_df.columns else 'Speed (m/s)'
-    dist_col = 'Distance' if 'Distance' in input_df.columns else 'dist_placeholder'
-
-    for index, row in input_df.iterrows():
-        # Basic Map Data
-        point_data = {
-            'lat': row['latitude'],
-            'lon': row['longitude'],
-            'seconds': row['seconds_elapsed'], # Crucial for sync
-            'time': str(row.get('Elapsed Time', '00:00'))
-        }
-        
-        # Add Stats if they exist (default to 0 or empty)
-        if has_stats:
-            point_data['rate'] = row.get(rate_col, 0)
-            point_data['split'] = row.get(split_col, 0)
-            point_data['dist'] = int(row.get(dist_col, 0))
-        else:
-            point_data['rate'] = "--"
-            point_data['split'] = 0
-            point_data['dist'] = "--"
-            
-        export_data.append(point_data)
-        
-    json_data = json.dumps(export_data)
-    
-    # 2. Encode Audio
-    b64_audio = base64.b64encode(audio_bytes).decode()
+
+    # One flat array per field, taken straight from the columns. Missing stats (no CSV at all,
+    # or no stroke close to that point) go out as NaN and show as "--".
+    data_rate = json.dumps(column_or_default(input_df, 'Rate', np.nan).tolist())
+    data_split = json.dumps(column_or_default(input_df, split_col, np.nan).tolist())
+    data_dist = json.dumps(column_or_default(input_df, 'Distance', np.nan).tolist())
+    data_time = json.dumps(column_or_default(input_df, 'Elapsed Time', '00:00').tolist())
+    # Point times as one flat (sorted) array, crucial for sync
+    json_seconds = json.dumps(input_df['seconds_elapsed'].tolist())
+    # Route travels as an encoded polyline, decoded once in the browser
+    encoded_route = json.dumps(encode_polyline(input_df['latitude'], input_df['longitude']))
+    # Streamlit gives a keyed container the CSS class "st-key-<key>"
+    player_selector = json.dumps(f".st-key-{player_key} audio")
     
-    # 3. Define HTML Template
+    # 2. Define HTML Template
     html_code = f"""
     <!DOCTYPE html>
     <html>
@@ -72,7 +134,6 @@ def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
             .stat-value {{ font-size: 16px; font-weight: bold; color: #333; }}
 
             #map {{ height: 400px; width: 100%; border-radius: 10px; margin-bottom: 10px; }}
-            audio {{ width: 100%; margin-top: 5px; }}
             .info-box {{ margin-bottom: 5px; color: #555; font-size: 12px; text-align: center; }}
         </style>
     </head>
@@ -87,12 +148,7 @@ def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
 
         <div id="map"></div>
         
-        <div class="info-box">Audio syncs automatically with the map position.</div>
-        
-        <audio id="audioPlayer" controls>
-            <source src="data:{audio_mime_type};base64,{b64_audio}" type="{audio_mime_type}">
-            Your browser does not support the audio element.
-        </audio>
+        <div class="info-box">Play the recording with the audio player above the map, the map position syncs automatically.</div>
 
         <script>
             // --- Helper: Format Seconds to MM:SS.s ---
@@ -104,12 +160,23 @@ def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
                 return m + ":" + s;
             }}
 
+            // --- Helper: "--" for missing stats ---
+            function orDash(value) {{
+                return (value === null || Number.isNaN(value)) ? "--" : value;
+            }}
+
             // 1. Load Data
-            var routePoints = {json_data};
+            {POLYLINE_DECODER_JS}
+            var routeRate = {data_rate};
+            var routeSplit = {data_split};
+            var routeDist = {data_dist};
+            var routeTime = {data_time};
+            var secs = {json_seconds};
+            var latlngs = decodePolyline({encoded_route});
             
             // 2. Initialize Map
-            var startLat = routePoints[0].lat;
-            var startLon = routePoints[0].lon;
+            var startLat = latlngs[0][0];
+            var startLon = latlngs[0][1];
             var map = L.map('map').setView([startLat, startLon], 14);
 
             L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
@@ -118,7 +185,6 @@ def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
             }}).addTo(map);
 
             // 3. Draw Route (Thicker Grey Line)
-            var latlngs = routePoints.map(p => [p.lat, p.lon]);
             var polyline = L.polyline(latlngs, {{color: 'grey', weight: 8, opacity: 0.6}}).addTo(map);
             map.fitBounds(polyline.getBounds());
 
@@ -132,42 +198,58 @@ def generate_audio_map_html(input_df, audio_bytes, audio_mime_type):
             var marker = L.marker([startLat, startLon], {{icon: boatIcon}}).addTo(map);
 
             // 5. Audio Sync Logic
-            var audio = document.getElementById("audioPlayer");
-            
-            // Optimization: Keep track of last index to avoid searching from 0 every time
-            var lastIdx = 0;
-
-            audio.ontimeupdate = function() {{
-                var currentTime = audio.currentTime;
-                
-                // Find closest point (Simple linear search from last known position)
-                var closestPoint = routePoints[lastIdx];
-                var minDiff = Math.abs(currentTime - routePoints[lastIdx].seconds);
-                
-                // Scan forward/backward from last index
-                // (Reset to 0 if we scrubbed backward)
-                var startSearch = (currentTime < routePoints[lastIdx].seconds) ? 0 : lastIdx;
-
-                for (var i = startSearch; i < routePoints.length; i++) {{
-                    var diff = Math.abs(currentTime - routePoints[i].seconds);
-                    if (diff <= minDiff) {{
-                        minDiff = diff;
-                        closestPoint = routePoints[i];
-                        lastIdx = i;
-                    }} else {{
-                        // Assuming sorted time, if diff starts growing, we passed the closest point
-                        break; 
-                    }}
+            // Index of the point closest to time t: binary search on the sorted times,
+            // so scrubbing anywhere in the recording costs ~log2(N) steps (ties go to the later point)
+            function nearestIdx(t) {{
+                var lo = 0, hi = secs.length;
+                while (lo < hi) {{
+                    var mid = (lo + hi) >>> 1;
+                    if (secs[mid] <= t) lo = mid + 1; else hi = mid;
                 }}
+                // lo is now the first point after t
+                if (lo === 0) return 0;
+                if (lo === secs.length) return lo - 1;
+                return (t - secs[lo - 1] < secs[lo] - t) ? lo - 1 : lo;
+            }}
+
+            // Last point shown, so ticks that land on the same point skip the DOM updates
+            var lastIdx = -1;
+
+            function syncToTime(currentTime) {{
+                var idx = nearestIdx(currentTime);
+                if (idx === lastIdx) return;
+                lastIdx = idx;
 
                 // Update UI
-                marker.setLatLng([closestPoint.lat, closestPoint.lon]);
+                marker.setLatLng(latlngs[idx]);
                 
-                document.getElementById("disp-rate").innerText = closestPoint.rate;
-                document.getElementById("disp-split").innerText = fmtSplit(closestPoint.split);
-                document.getElementById("disp-dist").innerText = closestPoint.dist;
-                document.getElementById("disp-time").innerText = closestPoint.time;
-            }};
+                document.getElementById("disp-rate").innerText = orDash(routeRate[idx]);
+                document.getElementById("disp-split").innerText = fmtSplit(routeSplit[idx]);
+                document.getElementById("disp-dist").innerText = orDash(routeDist[idx]);
+                document.getElementById("disp-time").innerText = orDash(routeTime[idx]);
+            }}
+
+            // The player is the st.audio element inside our keyed container in the parent page.
+            // NOTE: reading window.parent.document only works because Streamlit renders this HTML in a
+            // same-origin srcdoc iframe; in a cross-origin frame the lookup throws and the map just stays put.
+            // The player may render after this frame, and a rerun of the audio section can replace it,
+            // so check every 250 ms and (re)bind whenever the bound element is no longer on the page.
+            var playerSelector = {player_selector};
+            var boundAudio = null;
+
+            function onTimeUpdate() {{ syncToTime(this.currentTime); }}
+
+            function bindAudio() {{
+                if (boundAudio && boundAudio.isConnected) return;
+                var audio = null;
+                try {{ audio = window.parent.document.querySelector(playerSelector); }} catch (e) {{}}
+                if (!audio) return;
+                audio.addEventListener("timeupdate", onTimeUpdate);
+                boundAudio = audio;
+                lastIdx = -1; // new player: redraw on its first tick
+            }}
+            bindAudio();
+            setInterval(bindAudio, 250);
         </script>
     </body>
     </html>
@@ -182,8 +264,6 @@ def generate_client_side_replay(merged_df):
     import json
     
     # 1. Prepare Data for JS
-    export_data = []
-    
     # Handle column names flexibly
     rate_col = 'Rate' if 'Rate' in merged_df.columns else merged_df.columns[0]
     dist_col = 'Distance'
@@ -194,32 +274,13 @@ def generate_client_side_replay(merged_df):
     else:
         split_col = 'Speed (m/s)' 
 
-    chart_labels = [] 
-    data_rate = []
-    data_split = []
-
-    for index, row in merged_df.iterrows():
-        # Get values
-        dist_val = int(row.get(dist_col, 0))
-        rate_val = row.get(rate_col, 0)
-        split_val = row.get(split_col, 0) 
-
-        # Prepare Map/Stats Data
-        export_data.append({
-            'lat': row['latitude'],
-            'lon': row['longitude'],
-            'rate': rate_val,
-            'split': split_val,
-            'dist': dist_val,
-            'time': str(row.get('Elapsed Time', '00:00')),
-        })
-        
-        # Prepare Chart Data
-        chart_labels.append(dist_val)
-        data_rate.append(rate_val)
-        data_split.append(split_val)
-        
-    json_data = json.dumps(export_data)
+    # One flat array per field (shared by the chart and the stats display), taken straight from the columns
+    chart_labels = json.dumps(column_or_default(merged_df, dist_col, 0).astype(int).tolist())
+    data_rate = json.dumps(column_or_default(merged_df, rate_col, 0).tolist())
+    data_split = json.dumps(column_or_default(merged_df, split_col, 0).tolist())
+    data_time = json.dumps(column_or_default(merged_df, 'Elapsed Time', '00:00').astype(str).tolist())
+
+    encoded_route = json.dumps(encode_polyline(merged_df['latitude'], merged_df['longitude']))
     
     # 2. Define HTML Template
     html_code = f"""
@@ -330,11 +391,13 @@ def generate_client_side_replay(merged_df):
             }}
 
             // --- 1. Load RAW Data ---
-            const rawDataPoints = {json_data};
-            const rawLabels = {chart_labels};
+            {POLYLINE_DECODER_JS}
+            const rawLatLngs = decodePolyline({encoded_route});
+            const rawLabels = {chart_labels}; // Distance
             const rawRate = {data_rate};
             const rawSplit = {data_split};
-            const totalLen = rawDataPoints.length;
+            const rawTime = {data_time};
+            const totalLen = rawTime.length;
 
             // --- 2. Initialize UI Elements ---
             const replaySlider = document.getElementById("replaySlider");
@@ -347,8 +410,8 @@ def generate_client_side_replay(merged_df):
             trimEndSlider.value = totalLen - 1; // Default to full end
 
             // --- 3. Initialize Map ---
-            var startLat = rawDataPoints[0].lat;
-            var startLon = rawDataPoints[0].lon;
+            var startLat = rawLatLngs[0][0];
+            var startLon = rawLatLngs[0][1];
             
             var map = L.map('map', {{
                 fullscreenControl: true,
@@ -360,8 +423,7 @@ def generate_client_side_replay(merged_df):
             }}).addTo(map);
 
             // Polyline (Full Route)
-            var latlngs = rawDataPoints.map(p => [p.lat, p.lon]);
-            var polyline = L.polyline(latlngs, {{color: 'blue', weight: 3, opacity: 0.6}}).addTo(map);
+            var polyline = L.polyline(rawLatLngs, {{color: 'blue', weight: 3, opacity: 0.6}}).addTo(map);
             map.fitBounds(polyline.getBounds());
 
             var boatIcon = L.divIcon({{
@@ -514,14 +576,13 @@ def generate_client_side_replay(merged_df):
             // --- 6. Logic: Update Display (Map + Stats) ---
             function updateDisplay(idx) {{
                 idx = parseInt(idx);
-                var pt = rawDataPoints[idx];
                 
-                if (pt) {{
-                    marker.setLatLng([pt.lat, pt.lon]);
-                    document.getElementById("disp-rate").innerText = pt.rate;
-                    document.getElementById("disp-split").innerText = fmtSplit(pt.split);
-                    document.getElementById("disp-dist").innerText = pt.dist;
-                    document.getElementById("disp-time").innerText = pt.time;
+                if (idx >= 0 && idx < totalLen) {{
+                    marker.setLatLng(rawLatLngs[idx]);
+                    document.getElementById("disp-rate").innerText = rawRate[idx];
+                    document.getElementById("disp-split").innerText = fmtSplit(rawSplit[idx]);
+                    document.getElementById("disp-dist").innerText = rawLabels[idx];
+                    document.getElementById("disp-time").innerText = rawTime[idx];
                 }}
                 
                 myChart.draw(); // Redraw vertical line